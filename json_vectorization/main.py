@@ -1,9 +1,37 @@
-import json
+import orjson
 import os
-import shutil
+import logging
+import hashlib
 import requests
 import argparse
-from clip_vectorization import vectorize_text, vectorize_image
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from clip_vectorization import vectorize_text_batch, vectorize_image_batch, BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Dtypes the saved embeddings can be stored as; int8 also saves a per-vector scale
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+# Downloaded images are kept here between runs, named by a hash of their URL
+IMAGE_CACHE_DIR = ".image_cache"
+# Least recently used images are removed once the cache grows past this size
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Number of images downloaded concurrently
+MAX_DOWNLOAD_WORKERS = 16
+
+# (connect, read) timeout in seconds for every download
+REQUEST_TIMEOUT = (5, 30)
+
+# Shared across download threads so connections are kept alive and reused;
+# transient failures are retried with backoff
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64, max_retries=Retry(total=3, backoff_factor=0.3))
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
 
 
 def download_from_google_drive(google_drive_url, destination_path):
@@ -17,115 +45,357 @@ def download_from_google_drive(google_drive_url, destination_path):
     import re
     file_id_match = re.search(r'd/([^/]+)/', google_drive_url)
     if not file_id_match:
-        print(f"Invalid Google Drive link: {google_drive_url}")
+        logger.warning("Invalid Google Drive link: %s", google_drive_url)
         return False
     
     file_id = file_id_match.group(1)
     download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
     
     try:
-        response = requests.get(download_url, stream=True)
+        response = session.get(download_url, stream=True, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         with open(destination_path, 'wb') as file:
             for chunk in response.iter_content(1024):
                 file.write(chunk)
-        print(f"File downloaded successfully: {destination_path}")
+        logger.debug("File downloaded successfully: %s", destination_path)
         return True
     except requests.RequestException as e:
-        print(f"Error downloading file from Google Drive: {e}")
+        logger.warning("Error downloading file from Google Drive: %s", e)
         return False
 
 
-def process_json(input_json, output_json):
-    print("=" * 50)
-    download_folder = "downloaded_images"
-    os.makedirs(download_folder, exist_ok=True)  # Create a temporary folder for downloaded images
+def _download_one(image_url, image_path):
+    """
+    Downloads a single image from a direct or Google Drive link. The file is written
+    under a temporary name and only moved to image_path once complete, so an interrupted
+    download never leaves a truncated image in the cache.
+
+    Args:
+        image_url (str): The image URL.
+        image_path (str): The path where the image will be saved.
+
+    Returns:
+        tuple: (image_path, True if the download succeeded).
+    """
+    partial_path = image_path + ".part"
+    if "drive.google.com" in image_url:
+        # Handle Google Drive links
+        success = download_from_google_drive(image_url, partial_path)
+        if not success:
+            logger.warning("Failed to download %s", image_url)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return image_path, False
+    else:
+        # Handle direct links
+        try:
+            response = session.get(image_url, stream=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            with open(partial_path, 'wb') as img_file:
+                for chunk in response.iter_content(1024):
+                    img_file.write(chunk)
+        except requests.RequestException as e:
+            logger.warning("Failed to download %s: %s", image_url, e)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return image_path, False
+
+    os.replace(partial_path, image_path)
+    logger.debug("Saved to %s", image_path)
+    return image_path, True
+
+
+def cached_image_path(image_url, cache_dir=IMAGE_CACHE_DIR):
+    """
+    Returns where the image for a URL is stored in the image cache.
+
+    Args:
+        image_url (str): The image URL.
+        cache_dir (str): The image cache folder.
+    """
+    return os.path.join(cache_dir, hashlib.sha1(image_url.encode("utf-8")).hexdigest() + ".jpg")
+
+
+def trim_image_cache(cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used images until the cache is no larger than max_bytes.
+
+    Args:
+        cache_dir (str): The image cache folder.
+        max_bytes (int): The size budget for the folder.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        logger.debug("Evicted %s from the image cache", path)
+
+
+def batched(items, batch_size):
+    """
+    Splits a list into consecutive chunks of at most batch_size items.
+
+    Args:
+        items (list): The list to split.
+        batch_size (int): Maximum number of items per chunk.
+    """
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def l2_normalize(vectors):
+    """
+    Scales each row to unit L2 norm, so cosine similarity between rows is a plain dot product.
+
+    Args:
+        vectors (numpy.ndarray): A (N, dim) array.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def vectors_path(output_json):
+    """
+    Returns the path of the .npy file holding the vectors for an output keys file.
+
+    Args:
+        output_json (str): Path to the output JSON file.
+    """
+    return os.path.splitext(output_json)[0] + ".npy"
+
+
+def scales_path(output_json):
+    """
+    Returns the path of the .npy file holding the per-vector int8 scales for an output keys file.
+
+    Args:
+        output_json (str): Path to the output JSON file.
+    """
+    return os.path.splitext(output_json)[0] + ".scales.npy"
+
+
+def quantize(vectors, dtype):
+    """
+    Converts float32 vectors to the storage dtype. For int8 each row is scaled so its
+    largest absolute value maps to 127.
+
+    Args:
+        vectors (numpy.ndarray): A (N, dim) float32 array.
+        dtype (str): One of EMBEDDING_DTYPES.
+
+    Returns:
+        tuple: (stored vectors, per-row float32 scales for int8 or None).
+    """
+    if dtype == "int8":
+        if len(vectors) == 0:
+            return vectors.astype(np.int8), np.empty((0,), dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        quantized = np.clip(np.round(vectors / scales[:, None]), -128, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def dequantize(vectors, scales=None):
+    """
+    Converts stored vectors back to float32, applying the per-row scales for int8.
+
+    Args:
+        vectors (numpy.ndarray): The stored (N, dim) array.
+        scales (numpy.ndarray): The per-row scales, or None if the vectors are not int8.
+    """
+    if scales is not None:
+        return vectors.astype(np.float32) * scales[:, None]
+    return vectors.astype(np.float32)
+
+
+def load_embeddings(output_json):
+    """
+    Loads embeddings saved by save_embeddings. Older outputs stored as a JSON dict of
+    {paper_key: {key: vector}}, or saved before normalization, are converted on load.
+
+    Args:
+        output_json (str): Path to the output JSON file.
+
+    Returns:
+        tuple: (keys, vectors) where keys is a list of [paper_key, key] pairs and
+               vectors is a (len(keys), dim) L2-normalized float32 array, or None if there are no vectors.
+               Vectors stored as float16 or int8 are converted back to float32.
+    """
+    with open(output_json, 'rb') as outfile:
+        index = orjson.loads(outfile.read())
+
+    if "keys" not in index:
+        keys = []
+        vectors = []
+        for paper_key, paper_embeddings in index.items():
+            for key, vector in paper_embeddings.items():
+                if isinstance(vector, list):
+                    keys.append([paper_key, key])
+                    vectors.append(vector)
+        return keys, l2_normalize(np.asarray(vectors, dtype=np.float32)) if vectors else None
+
+    keys = index["keys"]
+    if not keys:
+        return keys, None
+    vectors = np.load(vectors_path(output_json))
+    scales = np.load(scales_path(output_json)) if index.get("dtype") == "int8" else None
+    vectors = dequantize(vectors, scales)
+    if not index.get("normalized"):
+        vectors = l2_normalize(vectors)
+    return keys, vectors
+
+
+def save_embeddings(output_json, keys, vectors, dtype="float32"):
+    """
+    Saves embeddings as a (N, dim) array of the given dtype in a .npy file next to output_json,
+    with output_json holding the [paper_key, key] pair for each row and a description
+    of the vectors ({"normalized": true, "dim": ..., "dtype": ...}) so consumers
+    can skip re-normalizing. int8 vectors also get a .scales.npy file with one scale per row.
+
+    Args:
+        output_json (str): Path to the output JSON file.
+        keys (list): [paper_key, key] pairs, one per row of vectors.
+        vectors (numpy.ndarray): The L2-normalized float32 embeddings, or None if there are none.
+        dtype (str): One of EMBEDDING_DTYPES.
+    """
+    if vectors is None:
+        vectors = np.empty((0, 0), dtype=np.float32)
+    vectors, scales = quantize(vectors, dtype)
+    np.save(vectors_path(output_json), vectors)
+    if scales is not None:
+        np.save(scales_path(output_json), scales)
+    elif os.path.exists(scales_path(output_json)):
+        os.remove(scales_path(output_json))  # Left over from an earlier int8 run
+    with open(output_json, 'wb') as outfile:
+        outfile.write(orjson.dumps({
+            "normalized": True,
+            "dim": vectors.shape[1],
+            "dtype": dtype,
+            "keys": keys,
+        }))
+
+
+def process_json(input_json, output_json, dtype="float32"):
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)  # Images persist here so re-runs skip the download
 
     # Load existing data from the consolidated output file if it exists
     if os.path.exists(output_json):
-        with open(output_json, 'r') as outfile:
-            consolidated_embeddings = json.load(outfile)
+        keys, vectors = load_embeddings(output_json)
     else:
-        consolidated_embeddings = {}
+        keys, vectors = [], None
+    processed_papers = {paper_key for paper_key, _ in keys}
 
     # Read the input JSON file
-    with open(input_json, 'r') as file:
-        data = json.load(file)
+    with open(input_json, 'rb') as file:
+        data = orjson.loads(file.read())
+
+    # Embeddings for the papers processed in this run, filled in by the batched passes below
+    new_embeddings = {}
+    text_items = []   # (paper_key, key, text)
+    downloads = []    # (paper_key, image_key, image_url, image_path)
+    image_items = []  # (paper_key, key, image_path)
 
-    # Iterate through papers in the input JSON
+    # Iterate through papers in the input JSON and collect everything that needs vectorizing
     for paper_key, paper_content in data.items():
-        print(f"Processing {paper_key}...")
+        logger.info("Processing %s...", paper_key)
         
         # Check if the paper is already processed
-        if paper_key in consolidated_embeddings:
-            print(f"{paper_key} already exists in the consolidated output. Skipping...")
+        if paper_key in processed_papers:
+            logger.info("%s already exists in the consolidated output. Skipping...", paper_key)
             continue
 
-        # Store embeddings for the current paper
-        paper_embeddings = {}
+        new_embeddings[paper_key] = {}
 
-        # Extract and vectorize abstract
+        # Extract abstract
         abstract = paper_content.get('abstract', 'No abstract provided')
-        print(f"Abstract: {abstract}")
-        paper_embeddings["abstract"] = vectorize_text(abstract)
+        logger.debug("Abstract: %s", abstract)
+        text_items.append((paper_key, "abstract", abstract))
 
-        # Extract and vectorize subsection values
+        # Extract subsection values
         sections = paper_content.get('sections', {})
         for section, value in sections.items():
-            print(f"{section}: {value}")
-            paper_embeddings[section] = vectorize_text(value)
+            logger.debug("%s: %s", section, value)
+            text_items.append((paper_key, section, value))
 
-        # Download images and vectorize them
+        # Collect images to download
         images = paper_content.get('images', {})
         for image_key, image_content in images.items():
             image_desc = image_content.get('image_desc', 'No description')
             image_url = image_content.get('image_location', None)
             if image_url:
-                image_path = os.path.join(download_folder, f"{paper_key}_{image_key}.jpg")
-                if "drive.google.com" in image_url:
-                    # Handle Google Drive links
-                    print(f"Downloading {image_desc} from {image_url}...")
-                    success = download_from_google_drive(image_url, image_path)
-                    if not success:
-                        print(f"Failed to download {image_url}")
-                        continue
-                else:
-                    # Handle direct links
-                    print(f"Downloading {image_desc} from {image_url}...")
-                    try:
-                        response = requests.get(image_url, stream=True)
-                        response.raise_for_status()
-                        with open(image_path, 'wb') as img_file:
-                            for chunk in response.iter_content(1024):
-                                img_file.write(chunk)
-                        print(f"Saved to {image_path}")
-                    except requests.RequestException as e:
-                        print(f"Failed to download {image_url}: {e}")
-                        continue
-
-                # Vectorize the image and add to embeddings
-                paper_embeddings[image_key] = vectorize_image(image_path)
-
-        # Add the paper's embeddings to the consolidated structure
-        consolidated_embeddings[paper_key] = paper_embeddings
-
-    # Save the consolidated embeddings to the output JSON file
-    with open(output_json, 'w') as outfile:
-        json.dump(consolidated_embeddings, outfile, indent=4)
-    print(f"Updated consolidated embeddings saved to {output_json}")
-
-    # Clean up the downloaded_images folder
-    shutil.rmtree(download_folder)
-    print(f"Temporary folder '{download_folder}' deleted.")
+                image_path = cached_image_path(image_url)
+                logger.debug("Using %s from %s...", image_desc, image_url)
+                downloads.append((paper_key, image_key, image_url, image_path))
+
+    # Download each distinct URL that is not cached yet, concurrently
+    downloaded = {}  # image_url -> True if it is available in the cache
+    pending = {}     # image_url -> image_path
+    for _, _, image_url, image_path in downloads:
+        if os.path.exists(image_path):
+            os.utime(image_path)  # Mark as recently used for trim_image_cache
+            downloaded[image_url] = True
+        else:
+            pending[image_url] = image_path
+    logger.info("%d images found in the image cache, downloading %d", len(downloaded), len(pending))
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+        results = executor.map(_download_one, pending.keys(), pending.values())
+        for image_url, (_, ok) in zip(pending.keys(), results):
+            downloaded[image_url] = ok
+
+    # Keep the images that are available, in input order
+    for paper_key, image_key, image_url, image_path in downloads:
+        if downloaded[image_url]:
+            image_items.append((paper_key, image_key, image_path))
+
+    # Vectorize texts and images in batches of BATCH_SIZE
+    for batch in batched(text_items, BATCH_SIZE):
+        batch_vectors = vectorize_text_batch([text for _, _, text in batch])
+        for (paper_key, key, _), vector in zip(batch, batch_vectors):
+            new_embeddings[paper_key][key] = vector
+
+    for batch in batched(image_items, BATCH_SIZE):
+        batch_vectors = vectorize_image_batch([image_path for _, _, image_path in batch])
+        for (paper_key, key, _), vector in zip(batch, batch_vectors):
+            new_embeddings[paper_key][key] = vector
+
+    # Append the papers' embeddings to the consolidated keys and vectors
+    new_vectors = []
+    for paper_key, paper_embeddings in new_embeddings.items():
+        for key, vector in paper_embeddings.items():
+            if vector is not None:
+                keys.append([paper_key, key])
+                new_vectors.append(vector)
+    if new_vectors:
+        # Normalize once here so every later cosine similarity is a dot product
+        new_vectors = l2_normalize(np.asarray(new_vectors, dtype=np.float32))
+        vectors = new_vectors if vectors is None else np.vstack([vectors, new_vectors])
+
+    # Save the consolidated embeddings to the output files
+    save_embeddings(output_json, keys, vectors, dtype)
+    logger.info("Updated consolidated embeddings saved to %s and %s", output_json, vectors_path(output_json))
+
+    # Keep the image cache within its size budget
+    trim_image_cache()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Process an input JSON file and append to a consolidated output.")
     parser.add_argument("input_json", help="Path to the input JSON file.")
-    parser.add_argument("output_json", help="Path to the consolidated output JSON file.")
+    parser.add_argument("output_json", help="Path to the consolidated output JSON file; vectors are saved next to it as .npy.")
+    parser.add_argument("--dtype", choices=EMBEDDING_DTYPES, default="float32",
+                        help="Storage dtype of the saved vectors; int8 stores a per-vector scale alongside.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level, e.g. DEBUG to show per-section details.")
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
     
-    process_json(args.input_json, args.output_json)
+    process_json(args.input_json, args.output_json, args.dtype)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,452 @@
+import os
+import io
+import logging
+import hashlib
+import threading
+import shutil
+import subprocess
+from collections import OrderedDict
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import torch
 import json
 import numpy as np
 
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import tensorrt as trt
+except ImportError:
+    trt = None
+
+logger = logging.getLogger(__name__)
+
 # Load the CLIP model and processor
 clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
 clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
 
+# Moved to the device once at import; runs in half precision on GPU while the CPU fallback stays in FP32
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+USE_FP16 = DEVICE == "cuda"
+clip_model = clip_model.to(DEVICE).eval()
+if USE_FP16:
+    clip_model = clip_model.half()
+if DEVICE == "cuda":
+    # Input shapes are fixed by padding, so cuDNN can autotune its kernels once per shape
+    torch.backends.cudnn.benchmark = True
+
+# Number of inputs sent through the model in a single forward pass
+BATCH_SIZE = 32
+
+# ONNX graphs for the text and image encoders, created by running this module as a script
+ONNX_DIR = os.environ.get("CLIP_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx"))
+ONNX_TEXTUAL_PATH = os.path.join(ONNX_DIR, "clip_textual.onnx")
+ONNX_VISUAL_PATH = os.path.join(ONNX_DIR, "clip_visual.onnx")
+ONNX_PROVIDERS = ["TensorrtExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider"]
+
+# TensorRT engines compiled from the ONNX graphs, used in preference to ONNX Runtime on GPU
+TRT_TEXTUAL_PATH = os.path.join(ONNX_DIR, "clip_textual.engine")
+TRT_VISUAL_PATH = os.path.join(ONNX_DIR, "clip_visual.engine")
+TRT_OPT_BATCH = 8
+TRT_MAX_BATCH = 16
+TEXT_MAX_LENGTH = 77
+
+# Batch sizes CUDA graphs are captured for on GPU; each request is padded up to the nearest one
+CUDA_GRAPH_BATCH_SIZES = (1, 8, 32)
+
+# Maximum number of embeddings kept in the in-process caches
+TEXT_CACHE_SIZE = 100_000
+IMAGE_CACHE_SIZE = 10_000
+
+
+class _EmbeddingCache:
+    """Thread-safe LRU cache mapping an input key to its embedding as a float32 array."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = np.asarray(embedding, dtype=np.float32)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# Text embeddings are keyed by the raw string, image embeddings by a hash of the file contents
+text_cache = _EmbeddingCache(TEXT_CACHE_SIZE)
+image_cache = _EmbeddingCache(IMAGE_CACHE_SIZE)
+
+
+class _TextualEncoder(torch.nn.Module):
+    """Wraps the CLIP text tower so it can be traced for ONNX export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _VisualEncoder(torch.nn.Module):
+    """Wraps the CLIP image tower so it can be traced for ONNX export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def export_onnx():
+    """
+    Exports the CLIP text and image encoders to ONNX_TEXTUAL_PATH and ONNX_VISUAL_PATH.
+    Only needs to be run once; the graphs are picked up on the next import.
+    """
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    # Export from a freshly loaded FP32 CPU model: clip_model may already hold FP16-rounded weights on GPU
+    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").eval()
+    dummy_text = clip_processor(text=["a photo"], return_tensors="pt", padding=True)
+    dummy_image = clip_processor(images=Image.new("RGB", (224, 224)), return_tensors="pt")
+
+    torch.onnx.export(
+        _TextualEncoder(model).eval(),
+        (dummy_text["input_ids"], dummy_text["attention_mask"]),
+        ONNX_TEXTUAL_PATH,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                      "attention_mask": {0: "batch", 1: "sequence"},
+                      "text_embeds": {0: "batch"}},
+        opset_version=15,
+    )
+    torch.onnx.export(
+        _VisualEncoder(model).eval(),
+        (dummy_image["pixel_values"],),
+        ONNX_VISUAL_PATH,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=15,
+    )
+    print(f"ONNX models saved to {ONNX_DIR}")
+
+
+def build_tensorrt_engines():
+    """
+    Compiles the exported ONNX graphs into FP16 TensorRT engines with trtexec.
+    Each engine has a dynamic batch profile of 1 to TRT_MAX_BATCH, tuned for TRT_OPT_BATCH.
+    """
+    text_shapes = f"input_ids:{{0}}x{TEXT_MAX_LENGTH},attention_mask:{{0}}x{TEXT_MAX_LENGTH}"
+    image_shapes = "pixel_values:{0}x3x224x224"
+    for onnx_path, engine_path, shapes in [(ONNX_TEXTUAL_PATH, TRT_TEXTUAL_PATH, text_shapes),
+                                           (ONNX_VISUAL_PATH, TRT_VISUAL_PATH, image_shapes)]:
+        subprocess.run([
+            "trtexec",
+            f"--onnx={onnx_path}",
+            "--fp16",
+            f"--minShapes={shapes.format(1)}",
+            f"--optShapes={shapes.format(TRT_OPT_BATCH)}",
+            f"--maxShapes={shapes.format(TRT_MAX_BATCH)}",
+            f"--saveEngine={engine_path}",
+        ], check=True)
+        print(f"TensorRT engine saved to {engine_path}")
+
+
+class _TensorRTEncoder:
+    """
+    Runs a serialized TensorRT engine through the tensor-name API (TensorRT 8.5 and later,
+    including 10). Pinned host and device buffers are allocated once, sized for
+    TRT_MAX_BATCH, and reused for every call; a lock keeps concurrent requests from
+    sharing them mid-call.
+    """
+
+    _DTYPES = {} if trt is None else {trt.float32: torch.float32, trt.float16: torch.float16, trt.int32: torch.int32}
+    if trt is not None and hasattr(trt, "int64"):
+        # TensorRT 10 keeps the int64 token ids of the ONNX text graph
+        _DTYPES[trt.int64] = torch.int64
+
+    def __init__(self, engine_path):
+        runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        with open(engine_path, "rb") as f:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        if self.engine is None:
+            # Engines are tied to the GPU and TensorRT version they were built with
+            raise RuntimeError(f"could not deserialize {engine_path}; rebuild it on this machine")
+        self.context = self.engine.create_execution_context()
+        self.input_names = []
+        self.output_names = []
+        self.host_buffers = {}
+        self.device_buffers = {}
+        for i in range(self.engine.num_io_tensors):
+            name = self.engine.get_tensor_name(i)
+            if self.engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT:
+                self.input_names.append(name)
+            else:
+                self.output_names.append(name)
+            shape, dtype = self._buffer_spec(self.engine, name)
+            self.host_buffers[name] = torch.empty(shape, dtype=dtype).pin_memory()
+            self.device_buffers[name] = torch.empty(shape, dtype=dtype, device="cuda")
+            self.context.set_tensor_address(name, self.device_buffers[name].data_ptr())
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _buffer_spec(cls, engine, name):
+        """
+        Returns the (shape, dtype) of the buffers for one engine tensor. Inputs are sized to
+        the maximum shape of the optimization profile, since their batch and sequence axes are
+        dynamic; outputs are sized for TRT_MAX_BATCH rows.
+        """
+        if engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT:
+            shape = tuple(engine.get_tensor_profile_shape(name, 0)[2])
+        else:
+            shape = (TRT_MAX_BATCH,) + tuple(engine.get_tensor_shape(name))[1:]
+        return shape, cls._DTYPES[engine.get_tensor_dtype(name)]
+
+    def __call__(self, inputs):
+        """
+        Args:
+            inputs (dict): Input tensor name -> CPU tensor, all with the same batch size. Tensors
+                are cast to the dtype the engine expects.
+
+        Returns:
+            numpy.ndarray: The (batch, dim) output of the engine as float32.
+        """
+        batch_size = next(iter(inputs.values())).shape[0]
+        output_name = self.output_names[0]
+        outputs = []
+        with self.lock:
+            stream = torch.cuda.current_stream()
+            for start in range(0, batch_size, TRT_MAX_BATCH):
+                n = min(TRT_MAX_BATCH, batch_size - start)
+                for name in self.input_names:
+                    host = self.host_buffers[name][:n]
+                    host.copy_(inputs[name][start:start + n])
+                    self.device_buffers[name][:n].copy_(host, non_blocking=True)
+                    self.context.set_input_shape(name, tuple(host.shape))
+                self.context.execute_async_v3(stream.cuda_stream)
+                output = self.host_buffers[output_name][:n]
+                output.copy_(self.device_buffers[output_name][:n])  # Synchronizes with the stream
+                outputs.append(output.float().numpy().copy())
+        return np.concatenate(outputs)
+
+
+def _load_tensorrt_engine(path):
+    """
+    Loads a TensorRT engine for GPU inference.
+
+    Returns:
+        _TensorRTEncoder: The engine, or None if TensorRT, a GPU or a usable engine file is not
+        available, in which case inference falls back to ONNX Runtime or PyTorch.
+    """
+    if trt is None or DEVICE != "cuda" or not os.path.exists(path):
+        return None
+    try:
+        return _TensorRTEncoder(path)
+    except Exception as e:
+        logger.warning("Could not load TensorRT engine %s, falling back: %s", path, e)
+        return None
+
+
+def _load_onnx_session(path):
+    """
+    Creates an ONNX Runtime session for the given graph, preferring TensorRT, then CUDA, then CPU.
+
+    Returns:
+        InferenceSession: The session, or None if onnxruntime or the graph is not available.
+    """
+    if ort is None or not os.path.exists(path):
+        return None
+    available = ort.get_available_providers()
+    providers = [provider for provider in ONNX_PROVIDERS if provider in available]
+    return ort.InferenceSession(path, providers=providers)
+
+
+# Loaded once at import so every request in a worker reuses the same sessions
+text_session = _load_onnx_session(ONNX_TEXTUAL_PATH)
+image_session = _load_onnx_session(ONNX_VISUAL_PATH)
+text_engine = _load_tensorrt_engine(TRT_TEXTUAL_PATH)
+image_engine = _load_tensorrt_engine(TRT_VISUAL_PATH)
+
+
+def _to_device(tensor):
+    """Copies a CPU tensor to DEVICE, through pinned memory so the transfer is asynchronous on GPU."""
+    if DEVICE == "cuda":
+        return tensor.pin_memory().to(DEVICE, non_blocking=True)
+    return tensor
+
+
+def _pad_text(inputs):
+    """Pads processor text outputs to TEXT_MAX_LENGTH tokens so every batch has the same sequence length."""
+    padding = TEXT_MAX_LENGTH - inputs["input_ids"].shape[1]
+    pad_token_id = clip_processor.tokenizer.pad_token_id
+    return {
+        "input_ids": torch.nn.functional.pad(inputs["input_ids"], (0, padding), value=pad_token_id),
+        "attention_mask": torch.nn.functional.pad(inputs["attention_mask"], (0, padding), value=0),
+    }
+
+
+def _text_features(inputs):
+    """Runs the PyTorch text encoder on device tensors."""
+    with torch.no_grad(), torch.autocast("cuda", dtype=torch.float16, enabled=USE_FP16):
+        return clip_model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+
+
+def _image_features(inputs):
+    """Runs the PyTorch image encoder on device tensors."""
+    with torch.no_grad(), torch.autocast("cuda", dtype=torch.float16, enabled=USE_FP16):
+        return clip_model.get_image_features(pixel_values=inputs["pixel_values"])
+
+
+class _CUDAGraphCaptureError(RuntimeError):
+    """Raised when capturing a CUDA graph fails after the capture has been ended."""
+
+
+class _CUDAGraphEncoder:
+    """
+    Replays CUDA graphs of an encoder captured at the batch sizes in CUDA_GRAPH_BATCH_SIZES,
+    removing per-kernel launch overhead. Inputs are padded up to the nearest captured size,
+    and each graph is captured the first time its size is needed.
+    """
+
+    def __init__(self, encode, input_specs):
+        """
+        Args:
+            encode (callable): Maps a dict of device tensors to the (batch, dim) output tensor.
+            input_specs (dict): Input name -> (shape of a single row, dtype).
+        """
+        self.encode = encode
+        self.input_specs = input_specs
+        self.enabled = True
+        self.graphs = {}
+        self.lock = threading.Lock()
+
+    def _capture(self, batch_size):
+        static_inputs = {name: torch.zeros((batch_size,) + shape, dtype=dtype, device=DEVICE)
+                         for name, (shape, dtype) in self.input_specs.items()}
+        # Warm up on a side stream before capturing, as torch.cuda.graph requires
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                self.encode(static_inputs)
+        torch.cuda.current_stream().wait_stream(stream)
+        graph = torch.cuda.CUDAGraph()
+        try:
+            with torch.cuda.graph(graph):
+                static_output = self.encode(static_inputs)
+        except Exception as e:
+            # torch.cuda.graph ends the capture on exit; only report a recoverable failure
+            # once the stream is no longer capturing, so the eager fallback can run safely
+            torch.cuda.synchronize()
+            if torch.cuda.is_current_stream_capturing():
+                raise
+            raise _CUDAGraphCaptureError(str(e)) from e
+        return graph, static_inputs, static_output
+
+    def __call__(self, inputs):
+        """
+        Args:
+            inputs (dict): Input name -> CPU tensor, all with the same batch size.
+
+        Returns:
+            numpy.ndarray: The (batch, dim) output of the encoder as float32.
+        """
+        batch_size = next(iter(inputs.values())).shape[0]
+        max_batch = CUDA_GRAPH_BATCH_SIZES[-1]
+        outputs = []
+        with self.lock:
+            for start in range(0, batch_size, max_batch):
+                n = min(max_batch, batch_size - start)
+                bucket = next(size for size in CUDA_GRAPH_BATCH_SIZES if size >= n)
+                if bucket not in self.graphs:
+                    self.graphs[bucket] = self._capture(bucket)
+                graph, static_inputs, static_output = self.graphs[bucket]
+                # Rows past n keep data from earlier calls; their outputs are discarded
+                for name, value in inputs.items():
+                    static_inputs[name][:n].copy_(_to_device(value[start:start + n]))
+                graph.replay()
+                outputs.append(static_output[:n].float().cpu().numpy())
+        return np.concatenate(outputs)
+
+
+def _load_cuda_graph_encoders():
+    """
+    Creates the CUDA graph encoders for the PyTorch model.
+
+    Returns:
+        tuple: (text encoder, image encoder), or (None, None) when not running on a GPU.
+    """
+    if DEVICE != "cuda":
+        return None, None
+    text_graph = _CUDAGraphEncoder(_text_features, {
+        "input_ids": ((TEXT_MAX_LENGTH,), torch.long),
+        "attention_mask": ((TEXT_MAX_LENGTH,), torch.long),
+    })
+    image_graph = _CUDAGraphEncoder(_image_features, {"pixel_values": ((3, 224, 224), clip_model.dtype)})
+    return text_graph, image_graph
+
+
+text_graph, image_graph = _load_cuda_graph_encoders()
+
+
+def _encode_text(inputs):
+    """Runs the text encoder on processor outputs and returns a (batch, dim) numpy array."""
+    if text_engine is not None:
+        # The engine profile has a fixed sequence length
+        return text_engine(_pad_text(inputs))
+    if text_session is not None:
+        return text_session.run(None, {
+            "input_ids": inputs["input_ids"].numpy(),
+            "attention_mask": inputs["attention_mask"].numpy(),
+        })[0]
+    if text_graph is not None and text_graph.enabled:
+        try:
+            return text_graph(_pad_text(inputs))
+        except _CUDAGraphCaptureError as e:
+            logger.warning("CUDA graph capture failed, using eager text encoding from now on: %s", e)
+            text_graph.enabled = False
+    inputs = {key: _to_device(value) for key, value in inputs.items()}
+    return _text_features(inputs).float().cpu().numpy()
+
+
+def _encode_image(inputs):
+    """Runs the image encoder on processor outputs and returns a (batch, dim) numpy array."""
+    if image_engine is not None:
+        return image_engine({"pixel_values": inputs["pixel_values"]})
+    if image_session is not None:
+        return image_session.run(None, {"pixel_values": inputs["pixel_values"].numpy()})[0]
+    if image_graph is not None and image_graph.enabled:
+        try:
+            return image_graph({"pixel_values": inputs["pixel_values"]})
+        except _CUDAGraphCaptureError as e:
+            logger.warning("CUDA graph capture failed, using eager image encoding from now on: %s", e)
+            image_graph.enabled = False
+    pixel_values = _to_device(inputs["pixel_values"])
+    if USE_FP16:
+        pixel_values = pixel_values.half()
+    return _image_features({"pixel_values": pixel_values}).float().cpu().numpy()
+
+
+def _image_key(image_bytes):
+    """Returns the cache key for an image: a hash of its raw file contents."""
+    return hashlib.blake2b(image_bytes).hexdigest()
+
+
 def vectorize_text(input_text):
     """
     Converts a text string into an embedding using the CLIP model.
@@ -19,14 +458,20 @@ def vectorize_text(input_text):
         list: The embedding of the text as a list.
     """
     try:
+        if not isinstance(input_text, str):
+            raise TypeError(f"expected a string, got {type(input_text).__name__}")
+        cached = text_cache.get(input_text)
+        if cached is not None:
+            return cached.tolist()
+
         # Preprocess and generate text embedding
         inputs = clip_processor(text=[input_text], return_tensors="pt", truncation=True)
-        with torch.no_grad():
-            text_embedding = clip_model.get_text_features(**inputs)
-            text_embedding = text_embedding.squeeze().numpy().tolist()  # Convert to list for JSON compatibility
+        text_embedding = _encode_text(inputs).squeeze()
+        text_cache.put(input_text, text_embedding)
+        text_embedding = text_embedding.tolist()  # Convert to list for JSON compatibility
         return text_embedding
     except Exception as e:
-        print(f"Error processing text: {e}")
+        logger.warning("Error processing text: %s", e)
         return None
 
 def vectorize_image(image_path):
@@ -40,13 +485,112 @@ def vectorize_image(image_path):
         list: The embedding of the image as a list.
     """
     try:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        key = _image_key(image_bytes)
+        cached = image_cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+
         # Load and preprocess the image
-        image = Image.open(image_path).convert("RGB")
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
         inputs = clip_processor(images=image, return_tensors="pt", truncation=True)
-        with torch.no_grad():
-            image_embedding = clip_model.get_image_features(**inputs)
-            image_embedding = image_embedding.squeeze().numpy().tolist()  # Convert to list for JSON compatibility
+        image_embedding = _encode_image(inputs).squeeze()
+        image_cache.put(key, image_embedding)
+        image_embedding = image_embedding.tolist()  # Convert to list for JSON compatibility
         return image_embedding
     except Exception as e:
-        print(f"Error processing image at {image_path}: {e}")
+        logger.warning("Error processing image at %s: %s", image_path, e)
         return None
+
+def vectorize_text_batch(texts):
+    """
+    Converts a list of text strings into embeddings with a single forward pass.
+    Texts already in the cache are not sent through the model; inputs that are not
+    strings get None.
+
+    Args:
+        texts (list): Input text strings to be vectorized.
+
+    Returns:
+        list: One embedding (as a list) per input text, or None for texts that could not be processed.
+    """
+    embeddings = [None] * len(texts)
+    misses = []
+    for i, text in enumerate(texts):
+        if not isinstance(text, str):
+            logger.debug("Skipping text: expected a string, got %s", type(text).__name__)
+            continue
+        cached = text_cache.get(text)
+        if cached is not None:
+            embeddings[i] = cached.tolist()
+        else:
+            misses.append(i)
+    if not misses:
+        return embeddings
+
+    try:
+        inputs = clip_processor(text=[texts[i] for i in misses], return_tensors="pt", padding=True, truncation=True)
+        encoded = _encode_text(inputs)
+    except Exception as e:
+        # Retry one at a time so a single bad text only loses its own embedding
+        logger.warning("Error processing text batch, retrying texts individually: %s", e)
+        for i in misses:
+            embeddings[i] = vectorize_text(texts[i])
+        return embeddings
+
+    for i, embedding in zip(misses, encoded):
+        text_cache.put(texts[i], embedding)
+        embeddings[i] = embedding.tolist()
+    return embeddings
+
+def vectorize_image_batch(image_paths):
+    """
+    Converts a list of images into embeddings with a single forward pass.
+    Images whose contents are already in the cache are not sent through the model.
+
+    Args:
+        image_paths (list): Paths to the input images to be vectorized.
+
+    Returns:
+        list: One embedding (as a list) per input image, or None for images that could not be processed.
+    """
+    embeddings = [None] * len(image_paths)
+    images = []
+    loaded = []  # (index, cache key) of each image in `images`
+    for i, image_path in enumerate(image_paths):
+        try:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+            key = _image_key(image_bytes)
+            cached = image_cache.get(key)
+            if cached is not None:
+                embeddings[i] = cached.tolist()
+                continue
+            images.append(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+            loaded.append((i, key))
+        except Exception as e:
+            logger.warning("Error processing image at %s: %s", image_path, e)
+    if not images:
+        return embeddings
+
+    try:
+        inputs = clip_processor(images=images, return_tensors="pt")
+        encoded = _encode_image(inputs)
+    except Exception as e:
+        # Retry one at a time so a single bad image only loses its own embedding
+        logger.warning("Error processing image batch, retrying images individually: %s", e)
+        for i, _ in loaded:
+            embeddings[i] = vectorize_image(image_paths[i])
+        return embeddings
+
+    for (i, key), embedding in zip(loaded, encoded):
+        image_cache.put(key, embedding)
+        embeddings[i] = embedding.tolist()
+    return embeddings
+
+
+if __name__ == "__main__":
+    export_onnx()
+    if shutil.which("trtexec"):
+        build_tensorrt_engines()
@@ -1,4 +1,4 @@
-import json
+import orjson
 import numpy as np
 import faiss
 
@@ -9,8 +9,8 @@ papers_data_json = "/Users/chandu/MS_Computer_Science_ASU/Final_Year/DPS/Project
 
 # Load data
 def load_json(file_path):
-    with open(file_path, 'r') as f:
-        mapping = json.load(f)
+    with open(file_path, 'rb') as f:
+        mapping = orjson.loads(f.read())
     return mapping
 
 
@@ -1,11 +1,14 @@
 from django.shortcuts import render
 from django.http import HttpResponse, JsonResponse
 from . import clip_vectorization,searchSimilarPaper
-import json
+import orjson
 from django.views.decorators.csrf import csrf_exempt
 # from openai import OpenAI
 from groq import Groq
 from django.conf import settings
+from django.core.cache import cache
+import hashlib
+import numpy as np
 import os
 # Create your views here.
 
@@ -22,7 +25,7 @@ client = Groq(api_key = groq_api_key)
 def getDataFromOpenAIAPI(request):
     if request.method == "POST":
         try:
-            data = json.loads(request.body)
+            data = orjson.loads(request.body)
             query = data.get("query", "")
             completion = client.chat.completions.create(
                     model="llama3-8b-8192",
@@ -74,23 +77,52 @@ def uploadFile(request):
     else:
         return JsonResponse({'error': 'No image file provided'}, status=400)
     
+def cachedEmbedding(key, compute):
+    """
+    Returns the embedding stored under key() in the shared Django cache, computing and storing it on a miss.
+    Embeddings are stored as float32 bytes with their dtype and shape so they stay compact in Redis.
+    Without a shared cache this just calls compute, which is cached in-process by clip_vectorization.
+    """
+    if not settings.SHARED_EMBEDDING_CACHE:
+        return compute()
+    cached = cache.get(key())
+    if cached is not None:
+        data, dtype, shape = cached
+        return np.frombuffer(data, dtype=dtype).reshape(shape).tolist()
+    embedding = compute()
+    if embedding is not None:
+        array = np.asarray(embedding, dtype=np.float32)
+        cache.set(key(), (array.tobytes(), array.dtype.str, array.shape))
+    return embedding
+
+def imageKey(imagePath):
+    with open(imagePath, 'rb') as f:
+        return "clip:image:" + hashlib.blake2b(f.read()).hexdigest()
+
 @csrf_exempt
 def getEmbedding(request):
     if request.method == 'POST':
         try:
             textEmbedding = []
             imageEmbedding = []
-            data = json.loads(request.body)
+            data = orjson.loads(request.body)
             type = data.get("type", "")
-            print(type)
             if type == "text":
                 text = data.get("text","")
-                textEmbedding = clip_vectorization.vectorize_text(text)
-                return JsonResponse({'response': textEmbedding})
+                if isinstance(text, str):
+                    key = lambda: "clip:text:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+                    textEmbedding = cachedEmbedding(key, lambda: clip_vectorization.vectorize_text(text))
+                else:
+                    textEmbedding = None
+                return HttpResponse(orjson.dumps({'response': textEmbedding}), content_type='application/json')
             else:
                 imagePath = data.get("imageFilePath","")
-                imageEmbedding = clip_vectorization.vectorize_image(imagePath)
-                return JsonResponse({'response': imageEmbedding})
+                # Anything but a string path (e.g. an int, which open() treats as a file descriptor) is rejected
+                if isinstance(imagePath, str) and os.path.isfile(imagePath):
+                    imageEmbedding = cachedEmbedding(lambda: imageKey(imagePath), lambda: clip_vectorization.vectorize_image(imagePath))
+                else:
+                    imageEmbedding = None
+                return HttpResponse(orjson.dumps({'response': imageEmbedding}), content_type='application/json')
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid request method.'}, status=400)
@@ -101,9 +133,8 @@ def getSimilarContent(request):
     os.environ["TOKENIZERS_PARALLELISM"] = "false"
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            data = orjson.loads(request.body)
             query_embedding = data.get("embedding", None)
-            print(query_embedding)
             if query_embedding is None:
                 return JsonResponse({'error': 'Embedding is required.'}, status=400)
 
@@ -83,6 +83,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# CLIP embeddings are cached here only when REDIS_URL is set, so workers share them;
+# otherwise each worker relies on the in-process cache in clip_vectorization.
+
+SHARED_EMBEDDING_CACHE = bool(os.environ.get('REDIS_URL'))
+
+if SHARED_EMBEDDING_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'TIMEOUT': None,
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
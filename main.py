@@ -4,14 +4,19 @@ import faiss
 
 # File paths
 json_file = "test_output.json"
+vectors_file = "test_output.npy"
+scales_file = "test_output.scales.npy"
 faiss_index_file = "faiss_index.idx"
 mapping_file = "embeddings_with_vectors.json"
 
-# Load data
-def load_data(file_path):
+# Load data: [paper_id, section_name] keys and the matching (N, dim) float32 vectors
+def load_data(file_path, vectors_path, scales_path):
     with open(file_path, 'r') as f:
-        data = json.load(f)
-    return data
+        index = json.load(f)
+    vectors = np.load(vectors_path).astype('float32')  # FAISS requires float32
+    if index.get("dtype") == "int8":
+        vectors *= np.load(scales_path)[:, None]  # Undo the per-vector int8 scaling
+    return index["keys"], vectors
 
 # Create FAISS index
 def create_faiss_index(embedding_dim):
@@ -19,21 +24,15 @@ def create_faiss_index(embedding_dim):
     return index
 
 # Add embeddings to FAISS index and save mappings with vectors
-def add_embeddings_to_index(data, index):
+def add_embeddings_to_index(keys, vectors, index):
+    index.add(vectors)  # Add all rows in one call
     paper_map = {}
-    id_counter = 0
-    
-    for paper_id, sections in data.items():
-        for section_name, embeddings in sections.items():
-            if isinstance(embeddings, list):  # Ensure embeddings are numeric arrays
-                vector = np.array(embeddings, dtype='float32')  # FAISS requires float32
-                index.add(np.expand_dims(vector, axis=0))  # Add to index
-                paper_map[id_counter] = {
-                    "paper_id": paper_id,
-                    "section_name": section_name,
-                    "vector": vector.tolist()  # Save embedding as a list for JSON
-                }
-                id_counter += 1
+    for id_counter, ((paper_id, section_name), vector) in enumerate(zip(keys, vectors)):
+        paper_map[id_counter] = {
+            "paper_id": paper_id,
+            "section_name": section_name,
+            "vector": vector.tolist()  # Save embedding as a list for JSON
+        }
     return paper_map
 
 # Save mapping to a JSON file
@@ -45,17 +44,16 @@ def save_mapping_to_file(paper_map, output_file):
 # Main workflow
 if __name__ == "__main__":
     # Load JSON data
-    data = load_data(json_file)
+    keys, vectors = load_data(json_file, vectors_file, scales_file)
     
-    # Assume embedding size from the first entry
-    first_embedding = next(iter(next(iter(data.values())).values()))
-    embedding_dim = len(first_embedding)
+    # Embedding size is the width of the vectors array
+    embedding_dim = vectors.shape[1]
     
     # Create FAISS index
     faiss_index = create_faiss_index(embedding_dim)
     
     # Populate FAISS index and create mapping with vectors
-    paper_map = add_embeddings_to_index(data, faiss_index)
+    paper_map = add_embeddings_to_index(keys, vectors, faiss_index)
     
     # Save the FAISS index for future use
     faiss.write_index(faiss_index, faiss_index_file)
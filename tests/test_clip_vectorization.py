@@ -0,0 +1,219 @@
+import os
+import types
+import tempfile
+import importlib.util
+import numpy as np
+import pytest
+import torch
+import transformers
+from PIL import Image
+from transformers import CLIPConfig, CLIPModel
+
+CLIP_VECTORIZATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "json_vectorization", "clip_vectorization.py")
+
+
+class StubTokenizer:
+    pad_token_id = 0
+
+
+class StubProcessor:
+    """Stand-in for CLIPProcessor: maps each character to a token id and resizes images to 224x224."""
+
+    tokenizer = StubTokenizer()
+
+    def __call__(self, text=None, images=None, return_tensors=None, padding=False, truncation=False):
+        if text is not None:
+            sequences = [[1] + [3 + ord(c) % 90 for c in t][:70] + [99] for t in text]
+            length = max(len(s) for s in sequences)
+            return {
+                "input_ids": torch.tensor([s + [0] * (length - len(s)) for s in sequences]),
+                "attention_mask": torch.tensor([[1] * len(s) + [0] * (length - len(s)) for s in sequences]),
+            }
+        images = images if isinstance(images, list) else [images]
+        pixels = np.stack([np.asarray(image.resize((224, 224)), dtype=np.float32).transpose(2, 0, 1) / 255
+                           for image in images])
+        return {"pixel_values": torch.from_numpy(pixels)}
+
+
+def tiny_clip_model():
+    """Returns a randomly initialised CLIP model small enough to run in tests."""
+    layers = dict(hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2)
+    config = CLIPConfig(
+        text_config=dict(vocab_size=100, max_position_embeddings=77, eos_token_id=2, **layers),
+        vision_config=dict(image_size=224, patch_size=32, **layers),
+        projection_dim=16,
+    )
+    torch.manual_seed(0)
+    return CLIPModel(config).eval()
+
+
+def load_clip_vectorization():
+    """
+    Imports json_vectorization/clip_vectorization.py with a tiny random CLIP model and a stub
+    processor in place of the pretrained ones, and with no ONNX graphs or engines to pick up.
+    """
+    model = tiny_clip_model()
+    saved = (transformers.CLIPModel.from_pretrained, transformers.CLIPProcessor.from_pretrained,
+             os.environ.get("CLIP_ONNX_DIR"))
+    transformers.CLIPModel.from_pretrained = classmethod(lambda cls, *args, **kwargs: model)
+    transformers.CLIPProcessor.from_pretrained = classmethod(lambda cls, *args, **kwargs: StubProcessor())
+    os.environ["CLIP_ONNX_DIR"] = tempfile.mkdtemp()
+    try:
+        spec = importlib.util.spec_from_file_location("clip_vectorization_under_test", CLIP_VECTORIZATION_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        transformers.CLIPModel.from_pretrained, transformers.CLIPProcessor.from_pretrained = saved[:2]
+        if saved[2] is None:
+            del os.environ["CLIP_ONNX_DIR"]
+        else:
+            os.environ["CLIP_ONNX_DIR"] = saved[2]
+    return module
+
+
+clip_vectorization = load_clip_vectorization()
+
+
+class FakeEngine:
+    """Answers the tensor queries of a TensorRT engine for the exported text graph."""
+
+    def __init__(self, tensors):
+        self.tensors = tensors
+
+    def get_tensor_mode(self, name):
+        return self.tensors[name]["mode"]
+
+    def get_tensor_shape(self, name):
+        return self.tensors[name]["shape"]
+
+    def get_tensor_dtype(self, name):
+        return self.tensors[name]["dtype"]
+
+    def get_tensor_profile_shape(self, name, profile):
+        return self.tensors[name]["profile"]
+
+
+def test_tensorrt_buffers_sized_from_profile_for_dynamic_axes(monkeypatch):
+    trt = types.SimpleNamespace(
+        TensorIOMode=types.SimpleNamespace(INPUT="input", OUTPUT="output"),
+        float32="float32", int64="int64",
+    )
+    monkeypatch.setattr(clip_vectorization, "trt", trt)
+    monkeypatch.setattr(clip_vectorization._TensorRTEncoder, "_DTYPES",
+                        {trt.float32: torch.float32, trt.int64: torch.int64})
+    max_batch, max_length = clip_vectorization.TRT_MAX_BATCH, clip_vectorization.TEXT_MAX_LENGTH
+    profile = [(1, max_length), (clip_vectorization.TRT_OPT_BATCH, max_length), (max_batch, max_length)]
+    engine = FakeEngine({
+        "input_ids": {"mode": "input", "shape": (-1, -1), "dtype": trt.int64, "profile": profile},
+        "text_embeds": {"mode": "output", "shape": (-1, 512), "dtype": trt.float32},
+    })
+
+    assert clip_vectorization._TensorRTEncoder._buffer_spec(engine, "input_ids") == ((max_batch, max_length), torch.int64)
+    assert clip_vectorization._TensorRTEncoder._buffer_spec(engine, "text_embeds") == ((max_batch, 512), torch.float32)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches(monkeypatch):
+    monkeypatch.setattr(clip_vectorization, "text_cache", clip_vectorization._EmbeddingCache(100))
+    monkeypatch.setattr(clip_vectorization, "image_cache", clip_vectorization._EmbeddingCache(100))
+
+
+def save_image(path, color):
+    Image.new("RGB", (64, 48), color).save(path)
+    return str(path)
+
+
+def test_text_batch_matches_single_texts_and_skips_non_strings():
+    texts = ["a red square", None, "a much longer sentence about transformers", {"nested": "dict"}]
+
+    embeddings = clip_vectorization.vectorize_text_batch(texts)
+
+    assert embeddings[1] is None and embeddings[3] is None
+    clip_vectorization.text_cache._entries.clear()
+    for i in (0, 2):
+        np.testing.assert_allclose(embeddings[i], clip_vectorization.vectorize_text(texts[i]), atol=1e-5)
+
+
+def test_text_batch_failure_retries_texts_individually(monkeypatch):
+    encode_text = clip_vectorization._encode_text
+
+    def fail_on_bad_text(inputs):
+        if (inputs["input_ids"] == 3 + ord("!") % 90).any():
+            raise RuntimeError("bad text")
+        return encode_text(inputs)
+
+    monkeypatch.setattr(clip_vectorization, "_encode_text", fail_on_bad_text)
+
+    embeddings = clip_vectorization.vectorize_text_batch(["first", "broken!", "third"])
+
+    assert embeddings[0] is not None and embeddings[2] is not None
+    assert embeddings[1] is None
+
+
+def test_image_batch_matches_single_images_and_skips_missing_files(tmp_path):
+    red = save_image(tmp_path / "red.png", (200, 10, 10))
+    blue = save_image(tmp_path / "blue.png", (10, 10, 200))
+
+    embeddings = clip_vectorization.vectorize_image_batch([red, str(tmp_path / "missing.png"), blue])
+
+    assert embeddings[1] is None
+    clip_vectorization.image_cache._entries.clear()
+    np.testing.assert_allclose(embeddings[0], clip_vectorization.vectorize_image(red), atol=1e-5)
+    np.testing.assert_allclose(embeddings[2], clip_vectorization.vectorize_image(blue), atol=1e-5)
+
+
+def test_image_batch_failure_retries_images_individually(monkeypatch, tmp_path):
+    red = save_image(tmp_path / "red.png", (200, 10, 10))
+    blue = save_image(tmp_path / "blue.png", (10, 10, 200))
+    encode_image = clip_vectorization._encode_image
+
+    def fail_on_batches(inputs):
+        if inputs["pixel_values"].shape[0] > 1:
+            raise RuntimeError("out of memory")
+        return encode_image(inputs)
+
+    monkeypatch.setattr(clip_vectorization, "_encode_image", fail_on_batches)
+
+    embeddings = clip_vectorization.vectorize_image_batch([red, blue])
+
+    assert all(embedding is not None for embedding in embeddings)
+    assert not np.allclose(embeddings[0], embeddings[1])
+
+
+def test_text_batch_only_encodes_cache_misses(monkeypatch):
+    first = clip_vectorization.vectorize_text_batch(["cached text"])[0]
+    encode_text = clip_vectorization._encode_text
+    batch_sizes = []
+
+    def counting_encode(inputs):
+        batch_sizes.append(inputs["input_ids"].shape[0])
+        return encode_text(inputs)
+
+    monkeypatch.setattr(clip_vectorization, "_encode_text", counting_encode)
+
+    embeddings = clip_vectorization.vectorize_text_batch(["cached text", "new text", "cached text"])
+
+    assert batch_sizes == [1]
+    assert embeddings[0] == first and embeddings[2] == first
+    assert clip_vectorization.vectorize_text("new text") == embeddings[1]
+    assert batch_sizes == [1]
+
+
+def test_image_cache_is_keyed_on_file_contents(monkeypatch, tmp_path):
+    red = save_image(tmp_path / "red.png", (200, 10, 10))
+    duplicate = tmp_path / "copy_of_red.png"
+    duplicate.write_bytes((tmp_path / "red.png").read_bytes())
+    encode_image = clip_vectorization._encode_image
+    batch_sizes = []
+
+    def counting_encode(inputs):
+        batch_sizes.append(inputs["pixel_values"].shape[0])
+        return encode_image(inputs)
+
+    monkeypatch.setattr(clip_vectorization, "_encode_image", counting_encode)
+
+    first = clip_vectorization.vectorize_image(red)
+    embeddings = clip_vectorization.vectorize_image_batch([str(duplicate), red])
+
+    assert batch_sizes == [1]
+    assert embeddings == [first, first]
@@ -5,14 +5,19 @@ import faiss
 
 # File paths
 input_json_file = "output_data.json"  # Replace with the path to your JSON input file
+vectors_file = "output_data.npy"
+scales_file = "output_data.scales.npy"
 faiss_index_file = "faiss_index.idx"
 mapping_file = "embeddings_with_vectors.json"
 
-# Load data
-def load_data(file_path):
+# Load data: [paper_id, section_name] keys and the matching (N, dim) float32 vectors
+def load_data(file_path, vectors_path, scales_path):
     with open(file_path, 'r') as f:
-        data = json.load(f)
-    return data
+        index = json.load(f)
+    vectors = np.load(vectors_path).astype('float32')
+    if index.get("dtype") == "int8":
+        vectors *= np.load(scales_path)[:, None]
+    return index["keys"], vectors
 
 # Create FAISS index
 def create_faiss_index(embedding_dim):
@@ -20,20 +25,15 @@ def create_faiss_index(embedding_dim):
     return index
 
 # Add embeddings to FAISS index
-def add_embeddings_to_index(data, index):
+def add_embeddings_to_index(keys, vectors, index):
+    index.add(vectors)
     paper_map = {}
-    id_counter = 0
-    for paper_id, sections in data.items():
-        for section_name, embeddings in sections.items():
-            if isinstance(embeddings, list):
-                vector = np.array(embeddings, dtype='float32')
-                index.add(np.expand_dims(vector, axis=0))
-                paper_map[id_counter] = {
-                    "paper_id": paper_id,
-                    "section_name": section_name,
-                    "vector": vector.tolist()
-                }
-                id_counter += 1
+    for id_counter, ((paper_id, section_name), vector) in enumerate(zip(keys, vectors)):
+        paper_map[id_counter] = {
+            "paper_id": paper_id,
+            "section_name": section_name,
+            "vector": vector.tolist()
+        }
     return paper_map
 
 # Save mapping to file
@@ -50,19 +50,19 @@ def test_faiss_index():
     if not os.path.exists(input_json_file):
         raise FileNotFoundError(f"Input file {input_json_file} not found. Ensure the file exists.")
 
-    data = load_data(input_json_file)
-    print(f"Loaded data from {input_json_file}.")
+    keys, vectors = load_data(input_json_file, vectors_file, scales_file)
+    print(f"Loaded data from {input_json_file} and {vectors_file}.")
+    assert len(keys) == len(vectors), "Keys and vectors are out of sync."
 
-    # Assume embedding size from the first entry
-    first_embedding = next(iter(next(iter(data.values())).values()))
-    embedding_dim = len(first_embedding)
+    # Embedding size is the width of the vectors array
+    embedding_dim = vectors.shape[1]
 
     # Create FAISS index
     faiss_index = create_faiss_index(embedding_dim)
     print(f"Created FAISS index with embedding dimension {embedding_dim}.")
 
     # Populate FAISS index and create mapping
-    paper_map = add_embeddings_to_index(data, faiss_index)
+    paper_map = add_embeddings_to_index(keys, vectors, faiss_index)
     print(f"Added {len(paper_map)} embeddings to the FAISS index.")
 
     # Save FAISS index
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import types
+import importlib.util
+import numpy as np
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "json_vectorization", "main.py")
+
+
+def load_vectorization_main():
+    """
+    Imports json_vectorization/main.py with a stand-in for clip_vectorization, so the
+    storage logic can be tested without loading the CLIP model. The stand-in returns
+    a distinct vector for every input: [len(text), 1, 2, 3] for texts.
+    """
+    stub = types.ModuleType("clip_vectorization")
+    stub.BATCH_SIZE = 2
+    stub.vectorize_text_batch = lambda texts: [[float(len(text)), 1.0, 2.0, 3.0] for text in texts]
+    stub.vectorize_image_batch = lambda paths: [[0.0, 0.0, 0.0, 1.0] for _ in paths]
+    saved = sys.modules.get("clip_vectorization")
+    sys.modules["clip_vectorization"] = stub
+    try:
+        spec = importlib.util.spec_from_file_location("json_vectorization_main", MAIN_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules["clip_vectorization"]
+        else:
+            sys.modules["clip_vectorization"] = saved
+    return module
+
+
+vectorization = load_vectorization_main()
+
+
+def test_save_and_load_embeddings_round_trip(tmp_path):
+    output_json = str(tmp_path / "out.json")
+    keys = [["paper_1", "abstract"], ["paper_1", "intro"], ["paper_2", "abstract"]]
+    vectors = vectorization.l2_normalize(np.arange(12, dtype=np.float32).reshape(3, 4) + 1)
+
+    vectorization.save_embeddings(output_json, keys, vectors)
+    loaded_keys, loaded_vectors = vectorization.load_embeddings(output_json)
+
+    assert loaded_keys == keys
+    assert loaded_vectors.dtype == np.float32
+    np.testing.assert_allclose(loaded_vectors, vectors)
+    assert os.path.exists(str(tmp_path / "out.npy"))
+
+
+def test_load_embeddings_converts_legacy_format(tmp_path):
+    output_json = tmp_path / "legacy.json"
+    output_json.write_text(json.dumps({
+        "paper_1": {"abstract": [3.0, 4.0], "figure_1": None},
+        "paper_2": {"abstract": [0.0, 2.0]},
+    }))
+
+    keys, vectors = vectorization.load_embeddings(str(output_json))
+
+    assert keys == [["paper_1", "abstract"], ["paper_2", "abstract"]]
+    np.testing.assert_allclose(vectors, [[0.6, 0.8], [0.0, 1.0]])
+
+
+def test_process_json_appends_in_sync(tmp_path):
+    output_json = str(tmp_path / "out.json")
+    first = tmp_path / "first.json"
+    first.write_text(json.dumps({"paper_1": {"abstract": "a", "sections": {"s1": "bb", "s2": "ccc"}}}))
+    second = tmp_path / "second.json"
+    second.write_text(json.dumps({"paper_2": {"abstract": "dddd"}, "paper_1": {"abstract": "ignored"}}))
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        vectorization.process_json(str(first), output_json)
+        vectorization.process_json(str(second), output_json)
+    finally:
+        os.chdir(cwd)
+
+    keys, vectors = vectorization.load_embeddings(output_json)
+    assert keys == [["paper_1", "abstract"], ["paper_1", "s1"], ["paper_1", "s2"], ["paper_2", "abstract"]]
+    assert vectors.shape == (4, 4)
+    expected = vectorization.l2_normalize(np.array([[n, 1, 2, 3] for n in (1, 2, 3, 4)], dtype=np.float32))
+    np.testing.assert_allclose(vectors, expected, rtol=1e-6)
+
+
+def test_quantize_dequantize_round_trip():
+    vectors = vectorization.l2_normalize(np.random.default_rng(0).normal(size=(5, 16)).astype(np.float32))
+
+    half, half_scales = vectorization.quantize(vectors, "float16")
+    assert half.dtype == np.float16 and half_scales is None
+    np.testing.assert_allclose(vectorization.dequantize(half), vectors, atol=1e-3)
+
+    quantized, scales = vectorization.quantize(vectors, "int8")
+    assert quantized.dtype == np.int8 and scales.shape == (5,)
+    assert np.abs(quantized).max(axis=1).tolist() == [127] * 5
+    np.testing.assert_allclose(vectorization.dequantize(quantized, scales), vectors, atol=scales.max())
+
+
+def test_quantize_handles_no_vectors():
+    quantized, scales = vectorization.quantize(np.empty((0, 0), dtype=np.float32), "int8")
+    assert quantized.shape == (0, 0) and scales.shape == (0,)
+
+
+def test_save_embeddings_removes_stale_scales(tmp_path):
+    output_json = str(tmp_path / "out.json")
+    vectors = vectorization.l2_normalize(np.ones((2, 4), dtype=np.float32))
+    keys = [["paper_1", "abstract"], ["paper_2", "abstract"]]
+
+    vectorization.save_embeddings(output_json, [], None, "int8")
+    vectorization.save_embeddings(output_json, keys, vectors, "int8")
+    assert os.path.exists(vectorization.scales_path(output_json))
+    np.testing.assert_allclose(vectorization.load_embeddings(output_json)[1], vectors, atol=1e-2)
+
+    vectorization.save_embeddings(output_json, keys, vectors, "float16")
+    assert not os.path.exists(vectorization.scales_path(output_json))
+    np.testing.assert_allclose(vectorization.load_embeddings(output_json)[1], vectors, atol=1e-3)
+
+
+def test_trim_image_cache_evicts_least_recently_used(tmp_path):
+    for age, name in enumerate(["newest", "middle", "oldest"]):
+        path = tmp_path / f"{name}.jpg"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 - age, 1000 - age))
+
+    vectorization.trim_image_cache(str(tmp_path), max_bytes=150)
+    assert sorted(os.listdir(tmp_path)) == ["newest.jpg"]
+
+    vectorization.trim_image_cache(str(tmp_path), max_bytes=100)
+    assert sorted(os.listdir(tmp_path)) == ["newest.jpg"]
+
+
+def test_failed_download_leaves_no_partial_file(tmp_path, monkeypatch):
+    class InterruptedResponse:
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size):
+            yield b"partial image data"
+            raise vectorization.requests.ConnectionError("connection reset")
+
+    monkeypatch.setattr(vectorization.session, "get", lambda *args, **kwargs: InterruptedResponse())
+    image_path = vectorization.cached_image_path("http://example.com/figure.png", str(tmp_path))
+
+    assert vectorization._download_one("http://example.com/figure.png", image_path) == (image_path, False)
+    assert os.listdir(tmp_path) == []